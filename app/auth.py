@@ -1,31 +1,48 @@
 from fastapi import HTTPException, status, Depends, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from typing import Optional
-from pymongo import MongoClient
-from datetime import datetime
+from typing import Optional, Dict
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from bson import ObjectId
+from cachetools import TTLCache
+from datetime import datetime, timezone
+import asyncio
+import logging
 import os
+import time
 from app.config import settings
 
-# MongoDB connection
-client = MongoClient(settings.DATABASE_URL)
+logger = logging.getLogger(__name__)
+
+# MongoDB connection; a bounded server selection timeout keeps operations against an
+# unreachable database (e.g. the background index creation) from holding up shutdown
+client = AsyncIOMotorClient(
+    settings.DATABASE_URL,
+    maxPoolSize=50,
+    serverSelectionTimeoutMS=settings.DATABASE_SERVER_SELECTION_TIMEOUT_MS
+)
 db = client.capibot_voice_recognition
 api_keys_collection = db.api_keys
 
 security = HTTPBearer(auto_error=False)
 
-async def get_api_key_from_header(x_api_key: Optional[str] = Header(None, alias="X-API-Key")):
-    """Extract API key from X-API-Key header"""
-    return x_api_key
+# In-process caches: valid keys -> key_doc, and recently rejected keys
+_key_cache: TTLCache = TTLCache(maxsize=settings.API_KEY_CACHE_SIZE, ttl=settings.API_KEY_CACHE_TTL)
+_invalid_key_cache: TTLCache = TTLCache(maxsize=settings.API_KEY_CACHE_SIZE, ttl=settings.API_KEY_NEGATIVE_CACHE_TTL)
+
+# last_used timestamps (epoch seconds) waiting to be written by flush_last_used()
+_pending_last_used: Dict[ObjectId, float] = {}
 
-async def get_api_key_from_auth(credentials: Optional[HTTPAuthorizationCredentials] = Depends(security)):
-    """Extract API key from Authorization header"""
-    if credentials:
-        return credentials.credentials
-    return None
+async def ensure_indexes():
+    """Create the unique index on api_keys.key used by the validation lookup"""
+    try:
+        await api_keys_collection.create_index("key", unique=True)
+    except Exception as e:
+        logger.error(f"Error creating API key indexes: {e}")
 
 async def validate_api_key(
-    api_key_header: Optional[str] = Depends(get_api_key_from_header),
-    api_key_auth: Optional[str] = Depends(get_api_key_from_auth),
+    api_key_header: Optional[str] = Header(None, alias="X-API-Key"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
     api_key_body: Optional[str] = None
 ):
     """
@@ -34,6 +51,7 @@ async def validate_api_key(
     2. Authorization header
     3. Request body
     """
+    api_key_auth = credentials.credentials if credentials else None
     api_key = api_key_header or api_key_auth or api_key_body
     
     if not api_key:
@@ -42,8 +60,15 @@ async def validate_api_key(
             detail="API key required. Provide it in X-API-Key header, Authorization header, or request body."
         )
     
-    # Check if API key exists and is active
-    key_doc = api_keys_collection.find_one({"key": api_key, "active": True})
+    # Check if API key exists and is active (cached to skip the database round-trip)
+    key_doc = _key_cache.get(api_key)
+    
+    if key_doc is None and api_key not in _invalid_key_cache:
+        key_doc = await api_keys_collection.find_one({"key": api_key, "active": True})
+        if key_doc:
+            _key_cache[api_key] = key_doc
+        else:
+            _invalid_key_cache[api_key] = True
     
     if not key_doc:
         raise HTTPException(
@@ -51,15 +76,41 @@ async def validate_api_key(
             detail="Invalid or inactive API key"
         )
     
-    # Update last_used timestamp
-    api_keys_collection.update_one(
-        {"_id": key_doc["_id"]},
-        {"$set": {"last_used": datetime.utcnow()}}
-    )
+    # Record last_used timestamp; written in batches by flush_last_used()
+    _pending_last_used[key_doc["_id"]] = time.time()
     
     return key_doc
 
-def create_api_key(name: str) -> str:
+async def flush_last_used():
+    """Write pending last_used timestamps to the database in a single bulk operation"""
+    if not _pending_last_used:
+        return
+    
+    drained = dict(_pending_last_used)
+    _pending_last_used.clear()
+    
+    operations = [
+        UpdateOne({"_id": key_id}, {"$set": {"last_used": datetime.fromtimestamp(last_used, timezone.utc)}})
+        for key_id, last_used in drained.items()
+    ]
+    try:
+        await api_keys_collection.bulk_write(operations, ordered=False)
+    except Exception:
+        # Keep the timestamps for the next flush unless a newer one arrived meanwhile
+        for key_id, last_used in drained.items():
+            _pending_last_used.setdefault(key_id, last_used)
+        raise
+
+async def flush_last_used_periodically():
+    """Background loop that flushes last_used timestamps every LAST_USED_FLUSH_INTERVAL seconds"""
+    while True:
+        await asyncio.sleep(settings.LAST_USED_FLUSH_INTERVAL)
+        try:
+            await flush_last_used()
+        except Exception as e:
+            logger.error(f"Error flushing API key last_used timestamps: {e}")
+
+async def create_api_key(name: str) -> str:
     """Create a new API key for a client"""
     import secrets
     api_key = secrets.token_urlsafe(32)
@@ -68,19 +119,21 @@ def create_api_key(name: str) -> str:
         "key": api_key,
         "name": name,
         "active": True,
-        "created_at": datetime.utcnow(),
+        "created_at": datetime.now(timezone.utc),
         "last_used": None
     }
     
-    api_keys_collection.insert_one(key_doc)
+    await api_keys_collection.insert_one(key_doc)
+    _invalid_key_cache.pop(api_key, None)
     return api_key
 
-def deactivate_api_key(api_key: str) -> bool:
+async def deactivate_api_key(api_key: str) -> bool:
     """Deactivate an API key"""
-    result = api_keys_collection.update_one(
+    result = await api_keys_collection.update_one(
         {"key": api_key},
         {"$set": {"active": False}}
     )
+    _key_cache.pop(api_key, None)
     return result.modified_count > 0
 
 
@@ -5,13 +5,30 @@ load_dotenv()
 
 class Settings:
     DATABASE_URL: str = os.getenv("DATABASE_URL", "mongodb://localhost:27017/capibot-voice-recognition")
+    DATABASE_SERVER_SELECTION_TIMEOUT_MS: int = int(os.getenv("DATABASE_SERVER_SELECTION_TIMEOUT_MS", "5000"))
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your-secret-key-here")
     WHISPER_MODEL: str = os.getenv("WHISPER_MODEL", "base")
+    WHISPER_DEVICE: str = os.getenv("WHISPER_DEVICE", "cpu")
+    WHISPER_COMPUTE_TYPE: str = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+    WHISPER_BEAM_SIZE: int = int(os.getenv("WHISPER_BEAM_SIZE", "1"))
+    WHISPER_VAD_FILTER: bool = os.getenv("WHISPER_VAD_FILTER", "true").lower() == "true"
+    TRANSCRIPTION_WORKERS: int = int(os.getenv("TRANSCRIPTION_WORKERS", "1"))
+    # Defaults to one admitted request per worker, so admitted requests never queue for the executor
+    MAX_CONCURRENT_TRANSCRIPTIONS: int = int(os.getenv("MAX_CONCURRENT_TRANSCRIPTIONS", str(TRANSCRIPTION_WORKERS)))
+    TRANSCRIPTION_QUEUE_TIMEOUT: float = float(os.getenv("TRANSCRIPTION_QUEUE_TIMEOUT", "0.1"))
+    
+    # API Key Cache Configuration
+    API_KEY_CACHE_SIZE: int = int(os.getenv("API_KEY_CACHE_SIZE", "10000"))
+    API_KEY_CACHE_TTL: int = int(os.getenv("API_KEY_CACHE_TTL", "60"))
+    API_KEY_NEGATIVE_CACHE_TTL: int = int(os.getenv("API_KEY_NEGATIVE_CACHE_TTL", "10"))
+    LAST_USED_FLUSH_INTERVAL: int = int(os.getenv("LAST_USED_FLUSH_INTERVAL", "5"))
     
     # Webhook Configuration
     N8N_WEBHOOK_URL: str = os.getenv("N8N_WEBHOOK_URL", "http://n8n:5678/webhook/voice-transcription")
     WEBHOOK_TIMEOUT: int = int(os.getenv("WEBHOOK_TIMEOUT", "30"))
     WEBHOOK_RETRIES: int = int(os.getenv("WEBHOOK_RETRIES", "3"))
+    WEBHOOK_CIRCUIT_THRESHOLD: int = int(os.getenv("WEBHOOK_CIRCUIT_THRESHOLD", "5"))
+    WEBHOOK_CIRCUIT_COOLDOWN: int = int(os.getenv("WEBHOOK_CIRCUIT_COOLDOWN", "30"))
     
     # API Configuration
     API_V1_STR: str = "/api/v1"
@@ -19,7 +36,7 @@ class Settings:
     
     # File upload limits
     MAX_FILE_SIZE: int = 25 * 1024 * 1024  # 25MB
-    ALLOWED_AUDIO_TYPES: list = ["audio/mpeg", "audio/wav", "audio/mp4", "audio/m4a", "audio/x-m4a", "audio/ogg"]
+    ALLOWED_AUDIO_TYPES: frozenset = frozenset({"audio/mpeg", "audio/wav", "audio/mp4", "audio/m4a", "audio/x-m4a", "audio/ogg"})
 
 settings = Settings()
 
@@ -1,11 +1,12 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, status, Depends
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, status, Depends, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from fastapi.responses import ORJSONResponse
+from typing import Optional, Tuple
 import tempfile
 import os
 from app.config import settings
 from app.models import TranscriptionRequest, TranscriptionResponse
-from app.auth import validate_api_key
+from app.auth import validate_api_key, ensure_indexes, flush_last_used, flush_last_used_periodically
 from app.services.transcription import transcription_service
 from app.services.webhook import webhook_service
 import logging
@@ -19,6 +20,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Tamanho dos blocos lidos do upload ao gravar o arquivo temporário
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1MB
+
 # Mapeamento de extensões para tipos MIME
 EXTENSION_TO_MIME = {
     '.mp3': 'audio/mpeg',
@@ -42,40 +46,86 @@ def get_mime_from_extension(filename: str) -> Optional[str]:
     ext = os.path.splitext(filename)[1].lower()
     return EXTENSION_TO_MIME.get(ext)
 
-def validate_audio_type(content_type: Optional[str], filename: Optional[str]) -> bool:
+def validate_audio_type(content_type: Optional[str], filename: Optional[str]) -> Tuple[bool, Optional[str]]:
     """
     Valida o tipo de áudio de forma flexível:
     1. Tenta validar pelo content-type normalizado
     2. Se falhar, tenta validar pela extensão do arquivo
+    Retorna (válido, tipo MIME): o tipo aceito ou, em caso de falha, o detectado pela extensão
     """
-    logger.info(f"Validando tipo de áudio: content_type='{content_type}', filename='{filename}'")
-    logger.info(f"Tipos permitidos: {settings.ALLOWED_AUDIO_TYPES}")
-    
-    # Normaliza o content-type
+    # Tenta validar pelo content-type normalizado
     normalized_type = normalize_content_type(content_type)
-    logger.info(f"Content-type normalizado: '{normalized_type}'")
-    
-    # Tenta validar pelo content-type
-    if normalized_type and normalized_type in settings.ALLOWED_AUDIO_TYPES:
-        logger.info(f"Validação bem-sucedida pelo content-type: '{normalized_type}'")
-        return True
+    if normalized_type in settings.ALLOWED_AUDIO_TYPES:
+        return True, normalized_type
     
     # Fallback: valida pela extensão do arquivo
-    if filename:
-        mime_from_ext = get_mime_from_extension(filename)
-        logger.info(f"Tipo MIME da extensão '{os.path.splitext(filename)[1]}': '{mime_from_ext}'")
-        if mime_from_ext and mime_from_ext in settings.ALLOWED_AUDIO_TYPES:
-            logger.info(f"Content-type '{content_type}' não está na lista, mas extensão '{os.path.splitext(filename)[1]}' é válida. Usando tipo MIME: {mime_from_ext}")
-            return True
+    mime_from_ext = get_mime_from_extension(filename)
+    if mime_from_ext in settings.ALLOWED_AUDIO_TYPES:
+        return True, mime_from_ext
     
     logger.warning(f"Validação falhou: content_type='{content_type}' (normalizado: '{normalized_type}'), filename='{filename}'")
-    return False
+    return False, mime_from_ext
+
+async def parse_transcription_request(request: Request) -> Optional[TranscriptionRequest]:
+    """
+    Lê o corpo JSON (opção base64) da requisição.
+    Como o endpoint declara um campo de arquivo, o FastAPI interpreta o corpo como formulário
+    e não preenche modelos JSON automaticamente.
+    """
+    if not (request.headers.get("content-type") or "").startswith("application/json"):
+        return None
+    try:
+        return TranscriptionRequest.model_validate(await request.json())
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid JSON body"
+        )
+
+# Referências às notificações de erro em andamento (evita coleta pelo GC)
+_error_notification_tasks: set = set()
+
+def notify_error(error_message: str, api_key_name: str, original_filename: Optional[str] = None):
+    """
+    Envia notificação de erro ao webhook n8n sem bloquear a resposta.
+    Usa asyncio.create_task porque BackgroundTasks não executa quando o endpoint levanta HTTPException.
+    """
+    task = asyncio.create_task(
+        webhook_service.send_error_notification(error_message, api_key_name, original_filename)
+    )
+    _error_notification_tasks.add(task)
+    task.add_done_callback(_error_notification_tasks.discard)
+
+# Controle de admissão: limita transcrições simultâneas e rejeita o excedente com 503
+transcription_semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_TRANSCRIPTIONS)
+
+async def run_transcription(func, *args):
+    """Executa a transcrição no pool dedicado, respeitando o limite de transcrições simultâneas"""
+    try:
+        await asyncio.wait_for(
+            transcription_semaphore.acquire(),
+            timeout=settings.TRANSCRIPTION_QUEUE_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        logger.warning("Transcrição rejeitada: limite de transcrições simultâneas atingido")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server at capacity, try again later",
+            headers={"Retry-After": "5"}
+        )
+    
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(transcription_service.executor, partial(func, *args))
+    finally:
+        transcription_semaphore.release()
 
 # Create FastAPI app
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="Microservice for Portuguese audio transcription using OpenAI Whisper",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -88,6 +138,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_background_tasks():
+    """Create database indexes and start periodic flush of API key last_used timestamps"""
+    # Run in background so an unreachable database doesn't block startup
+    app.state.index_creation = asyncio.create_task(ensure_indexes())
+    app.state.last_used_flusher = asyncio.create_task(flush_last_used_periodically())
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Stop background tasks, write pending last_used timestamps and close the webhook client"""
+    app.state.index_creation.cancel()
+    app.state.last_used_flusher.cancel()
+    try:
+        await flush_last_used()
+    except Exception as e:
+        logger.error(f"Error flushing API key last_used timestamps on shutdown: {e}")
+    await webhook_service.close()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -108,13 +176,13 @@ async def health_check():
 
 @app.post("/transcribe")
 async def transcribe_audio(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    
     # File upload option
     audio: Optional[UploadFile] = File(None),
     api_key_file: Optional[str] = Form(None),
     
-    # Base64 option
-    request_data: Optional[TranscriptionRequest] = None,
-    
     # Authentication
     authenticated_key: dict = Depends(validate_api_key)
 ):
@@ -130,8 +198,10 @@ async def transcribe_audio(
     - Authorization header  
     - api_key in request body
     
-    The transcription result is sent to the configured n8n webhook.
+    The transcription result is sent to the configured n8n webhook in the
+    background, after the response is returned.
     """
+    api_key_name = authenticated_key.get("name", "unknown")
     
     try:
         text = ""
@@ -139,6 +209,7 @@ async def transcribe_audio(
         duration = 0.0
         original_filename = None
         audio_size = None
+        request_data = await parse_transcription_request(request)
         
         # Handle file upload
         if audio and audio.filename:
@@ -149,18 +220,17 @@ async def transcribe_audio(
             logger.info(f"Recebendo arquivo de áudio: filename='{original_filename}', content_type='{audio.content_type}', size={audio_size}")
             
             # Validate file type (validação flexível)
-            if not validate_audio_type(audio.content_type, original_filename):
-                # Tenta obter o tipo MIME da extensão para a mensagem de erro
-                mime_from_ext = get_mime_from_extension(original_filename) if original_filename else None
+            is_valid_type, mime_from_ext = validate_audio_type(audio.content_type, original_filename)
+            if not is_valid_type:
                 error_detail = f"Unsupported audio type. Received: content_type='{audio.content_type}', filename='{original_filename}'"
                 if mime_from_ext:
                     error_detail += f", detected_mime_from_extension='{mime_from_ext}'"
-                error_detail += f". Allowed types: {settings.ALLOWED_AUDIO_TYPES}"
+                error_detail += f". Allowed types: {sorted(settings.ALLOWED_AUDIO_TYPES)}"
                 
                 logger.warning(f"Tipo de áudio rejeitado: content_type='{audio.content_type}', filename='{original_filename}'")
-                await webhook_service.send_error_notification(
+                notify_error(
                     f"Unsupported audio type: {audio.content_type}",
-                    authenticated_key.get("name", "unknown"),
+                    api_key_name,
                     original_filename
                 )
                 raise HTTPException(
@@ -172,9 +242,9 @@ async def transcribe_audio(
             
             # Validate file size
             if audio.size and audio.size > settings.MAX_FILE_SIZE:
-                await webhook_service.send_error_notification(
+                notify_error(
                     f"File too large: {audio.size} bytes",
-                    authenticated_key.get("name", "unknown"),
+                    api_key_name,
                     original_filename
                 )
                 raise HTTPException(
@@ -182,18 +252,44 @@ async def transcribe_audio(
                     detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE} bytes"
                 )
             
-            # Save uploaded file temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(audio.filename)[1]) as temp_file:
-                content = await audio.read()
-                temp_file.write(content)
-                temp_file_path = temp_file.name
+            # Stream uploaded file to a temporary file in chunks
+            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(audio.filename)[1])
+            temp_file_path = temp_file.name
             
             try:
+                with temp_file:
+                    bytes_written = 0
+                    chunk = await audio.read(UPLOAD_CHUNK_SIZE)
+                    while chunk:
+                        bytes_written += len(chunk)
+                        # Enforce the limit while reading, the declared size may be missing or wrong
+                        if bytes_written > settings.MAX_FILE_SIZE:
+                            notify_error(
+                                f"File too large: more than {settings.MAX_FILE_SIZE} bytes",
+                                api_key_name,
+                                original_filename
+                            )
+                            raise HTTPException(
+                                status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE} bytes"
+                            )
+                        # Write the current chunk to disk while the next one is read from the upload.
+                        # Both are awaited before raising, so a failed read can't close the file
+                        # while the write thread is still using it
+                        written, chunk = await asyncio.gather(
+                            asyncio.to_thread(temp_file.write, chunk),
+                            audio.read(UPLOAD_CHUNK_SIZE),
+                            return_exceptions=True
+                        )
+                        for result in (written, chunk):
+                            if isinstance(result, BaseException):
+                                raise result
+                
                 # Validate and transcribe
                 if not transcription_service.validate_audio_file(temp_file_path):
-                    await webhook_service.send_error_notification(
+                    notify_error(
                         "Invalid audio file format or size",
-                        authenticated_key.get("name", "unknown"),
+                        api_key_name,
                         original_filename
                     )
                     raise HTTPException(
@@ -201,11 +297,9 @@ async def transcribe_audio(
                         detail="Invalid audio file format or size"
                     )
                 
-                # Run CPU-bound transcription in a separate thread
-                loop = asyncio.get_running_loop()
-                text, language, duration = await loop.run_in_executor(
-                    None, 
-                    partial(transcription_service.transcribe_audio_file, temp_file_path)
+                # Run CPU-bound transcription in the dedicated transcription pool
+                text, language, duration = await run_transcription(
+                    transcription_service.transcribe_audio_file, temp_file_path
                 )
                 
             finally:
@@ -215,17 +309,15 @@ async def transcribe_audio(
         
         # Handle base64 audio
         elif request_data and request_data.audio_base64:
-            # Run CPU-bound transcription in a separate thread
-            loop = asyncio.get_running_loop()
-            text, language, duration = await loop.run_in_executor(
-                None,
-                partial(transcription_service.transcribe_base64_audio, request_data.audio_base64)
+            # Run CPU-bound transcription in the dedicated transcription pool
+            text, language, duration = await run_transcription(
+                transcription_service.transcribe_base64_audio, request_data.audio_base64
             )
         
         else:
-            await webhook_service.send_error_notification(
+            notify_error(
                 "No audio data provided",
-                authenticated_key.get("name", "unknown"),
+                api_key_name,
                 None
             )
             raise HTTPException(
@@ -233,19 +325,16 @@ async def transcribe_audio(
                 detail="Either audio file or audio_base64 must be provided"
             )
         
-        # Send result to n8n webhook (optional, don't fail if it doesn't work)
-        webhook_success = False
-        try:
-            webhook_success = await webhook_service.send_transcription_result(
-                text=text,
-                language=language,
-                duration=duration,
-                api_key_name=authenticated_key.get("name", "unknown"),
-                original_filename=original_filename,
-                audio_size=audio_size
-            )
-        except Exception as e:
-            logger.warning(f"Failed to send result to n8n webhook: {e}")
+        # Send result to n8n webhook after the response is returned (optional, doesn't affect the client)
+        background_tasks.add_task(
+            webhook_service.send_transcription_result,
+            text=text,
+            language=language,
+            duration=duration,
+            api_key_name=api_key_name,
+            original_filename=original_filename,
+            audio_size=audio_size
+        )
         
         # Return transcription result directly to the client
         return {
@@ -254,7 +343,7 @@ async def transcribe_audio(
             "text": text,
             "language": language,
             "duration": duration,
-            "webhook_delivered": webhook_success,
+            "webhook_delivered": None,
             "transcription_id": f"trans_{authenticated_key.get('_id', 'unknown')}_{int(duration) if duration else 0}"
         }
             
@@ -262,9 +351,9 @@ async def transcribe_audio(
         raise
     except Exception as e:
         logger.error(f"Unexpected error in transcription: {e}")
-        await webhook_service.send_error_notification(
+        notify_error(
             f"Internal server error: {str(e)}",
-            authenticated_key.get("name", "unknown"),
+            api_key_name,
             original_filename
         )
         raise HTTPException(
@@ -278,7 +367,7 @@ async def create_api_key(name: str = Form(...)):
     from app.auth import create_api_key
     
     try:
-        api_key = create_api_key(name)
+        api_key = await create_api_key(name)
         return {
             "message": "API key created successfully",
             "api_key": api_key,
@@ -296,7 +385,7 @@ async def deactivate_api_key(api_key: str = Form(...)):
     from app.auth import deactivate_api_key
     
     try:
-        success = deactivate_api_key(api_key)
+        success = await deactivate_api_key(api_key)
         if success:
             return {"message": "API key deactivated successfully"}
         else:
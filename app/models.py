@@ -1,11 +1,11 @@
 from datetime import datetime, timezone
 from typing import Optional, Any
-from pydantic import BaseModel, Field, GetJsonSchemaHandler
+from pydantic import BaseModel, ConfigDict, Field, GetJsonSchemaHandler
 from pydantic.json_schema import JsonSchemaValue
 from pydantic_core import core_schema
 from bson import ObjectId
 
-class PyObjectId(ObjectId):
+class PyObjectId:
     @classmethod
     def __get_pydantic_core_schema__(cls, source_type: Any, handler) -> core_schema.CoreSchema:
         return core_schema.json_or_python_schema(
@@ -35,17 +35,14 @@ class PyObjectId(ObjectId):
         return {"type": "string"}
 
 class APIKey(BaseModel):
-    id: Optional[PyObjectId] = Field(default_factory=PyObjectId, alias="_id")
+    id: Optional[PyObjectId] = Field(default_factory=ObjectId, alias="_id")
     key: str = Field(..., description="Unique API key")
     name: str = Field(..., description="Client name")
     active: bool = Field(default=True, description="Whether the key is active")
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     last_used: Optional[datetime] = Field(default=None)
 
-    class Config:
-        populate_by_name = True
-        arbitrary_types_allowed = True
-        json_encoders = {ObjectId: str}
+    model_config = ConfigDict(populate_by_name=True, arbitrary_types_allowed=True)
 
 class TranscriptionRequest(BaseModel):
     audio_base64: Optional[str] = Field(None, description="Base64 encoded audio data")
@@ -1,25 +1,40 @@
-import whisper
+from faster_whisper import WhisperModel
 import base64
+import concurrent.futures
 import io
-import tempfile
 import os
-from typing import Optional, Tuple
+from typing import BinaryIO, Optional, Tuple, Union
 from fastapi import HTTPException, status
 from app.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Base64 characters read per decoding step
+BASE64_CHUNK_SIZE = 1 << 20
+
 class TranscriptionService:
     def __init__(self):
         self.model = None
+        # Dedicated pool so transcriptions don't compete for cores in the default executor
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=settings.TRANSCRIPTION_WORKERS,
+            thread_name_prefix="whisper"
+        )
         self._load_model()
     
     def _load_model(self):
         """Load the Whisper model"""
         try:
             logger.info(f"Loading Whisper model: {settings.WHISPER_MODEL}")
-            self.model = whisper.load_model(settings.WHISPER_MODEL)
+            self.model = WhisperModel(
+                settings.WHISPER_MODEL,
+                device=settings.WHISPER_DEVICE,
+                compute_type=settings.WHISPER_COMPUTE_TYPE,
+                # Split the cores between workers so parallel transcriptions don't oversubscribe
+                cpu_threads=max(1, (os.cpu_count() or 1) // settings.TRANSCRIPTION_WORKERS),
+                num_workers=settings.TRANSCRIPTION_WORKERS
+            )
             logger.info("Whisper model loaded successfully")
         except Exception as e:
             logger.error(f"Error loading Whisper model: {e}")
@@ -28,9 +43,9 @@ class TranscriptionService:
                 detail="Failed to load speech recognition model"
             )
     
-    def transcribe_audio_file(self, audio_file_path: str) -> Tuple[str, str, float]:
+    def transcribe_audio_file(self, audio_file: Union[str, BinaryIO]) -> Tuple[str, str, float]:
         """
-        Transcribe audio from file path
+        Transcribe audio from a file path or an in-memory file object
         Returns: (text, language, duration)
         """
         if not self.model:
@@ -41,47 +56,25 @@ class TranscriptionService:
         
         try:
             # Transcribe with Portuguese language hint
-            result = self.model.transcribe(
-                audio_file_path,
+            segments, info = self.model.transcribe(
+                audio_file,
                 language="pt",  # Force Portuguese
-                fp16=False  # Use fp32 for better compatibility
+                beam_size=settings.WHISPER_BEAM_SIZE,
+                vad_filter=settings.WHISPER_VAD_FILTER
             )
             
-            text = result["text"].strip()
-            language = result.get("language", "pt")
-            
-            # Calculate duration from segments (more accurate)
-            segments = result.get("segments", [])
-            if segments:
-                # Get the end time of the last segment
-                duration = segments[-1].get("end", 0.0)
-            else:
-                # Fallback: approximate duration
-                duration = 0.0
+            # Segments are generated lazily, joining them runs the decoding
+            text = "".join(segment.text for segment in segments).strip()
+            language = info.language or "pt"
+            duration = info.duration
             
             return text, language, duration
             
-        except FileNotFoundError as e:
-            if "ffmpeg" in str(e).lower():
-                logger.error(f"Transcription error: ffmpeg not found. Please install ffmpeg: brew install ffmpeg (macOS) or apt-get install ffmpeg (Linux)")
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="ffmpeg is required for audio transcription but is not installed. Please install ffmpeg: brew install ffmpeg (macOS) or apt-get install ffmpeg (Linux)"
-                )
-            else:
-                logger.error(f"Transcription error: {e}")
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Failed to transcribe audio: {str(e)}"
-                )
         except Exception as e:
             logger.error(f"Transcription error: {e}")
-            error_msg = str(e)
-            if "ffmpeg" in error_msg.lower():
-                error_msg = "ffmpeg is required for audio transcription but is not installed. Please install ffmpeg: brew install ffmpeg (macOS) or apt-get install ffmpeg (Linux)"
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Failed to transcribe audio: {error_msg}"
+                detail=f"Failed to transcribe audio: {str(e)}"
             )
     
     def transcribe_base64_audio(self, audio_base64: str) -> Tuple[str, str, float]:
@@ -90,23 +83,9 @@ class TranscriptionService:
         Returns: (text, language, duration)
         """
         try:
-            # Decode base64 audio
-            audio_data = base64.b64decode(audio_base64)
-            
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
+            # Decoded in memory by PyAV, no temporary file or ffmpeg process needed
+            return self.transcribe_audio_file(self._decode_base64_audio(audio_base64))
             
-            try:
-                # Transcribe the temporary file
-                result = self.transcribe_audio_file(temp_file_path)
-                return result
-            finally:
-                # Clean up temporary file
-                if os.path.exists(temp_file_path):
-                    os.unlink(temp_file_path)
-                    
         except Exception as e:
             logger.error(f"Base64 transcription error: {e}")
             raise HTTPException(
@@ -114,6 +93,29 @@ class TranscriptionService:
                 detail=f"Failed to process base64 audio: {str(e)}"
             )
     
+    def _decode_base64_audio(self, audio_base64: str) -> io.BytesIO:
+        """
+        Decode base64 audio in chunks, without an intermediate copy of the whole input.
+        Accepts an optional data URI prefix (data:audio/mp3;base64,...) and
+        whitespace or line breaks anywhere in the payload
+        """
+        start = audio_base64.index(",") + 1 if audio_base64.startswith("data:") else 0
+        
+        buffer = io.BytesIO()
+        pending = ""
+        for offset in range(start, len(audio_base64), BASE64_CHUNK_SIZE):
+            # Whitespace shifts the 4-character groups, so the incomplete tail of each
+            # slice is carried over and decoded together with the next one
+            pending += "".join(audio_base64[offset:offset + BASE64_CHUNK_SIZE].split())
+            complete = len(pending) - len(pending) % 4
+            buffer.write(base64.b64decode(pending[:complete]))
+            pending = pending[complete:]
+        if pending:
+            # Leftover characters mean the input was truncated or unpadded
+            buffer.write(base64.b64decode(pending))
+        buffer.seek(0)
+        return buffer
+    
     def validate_audio_file(self, file_path: str) -> bool:
         """Validate audio file format and size"""
         if not os.path.exists(file_path):
@@ -1,15 +1,59 @@
 import httpx
 import asyncio
+import random
+import time
 from typing import Dict, Any, Optional
-from datetime import datetime
-import json
+from datetime import datetime, timezone
+import logging
+import orjson
 from app.config import settings
 
+logger = logging.getLogger(__name__)
+
 class WebhookService:
     def __init__(self):
         self.webhook_url = settings.N8N_WEBHOOK_URL
         self.timeout = settings.WEBHOOK_TIMEOUT
         self.retries = settings.WEBHOOK_RETRIES
+        self._client: Optional[httpx.AsyncClient] = None
+        
+        # Circuit breaker: after consecutive failures, skip delivery until the cooldown ends
+        self.circuit_threshold = settings.WEBHOOK_CIRCUIT_THRESHOLD
+        self.circuit_cooldown = settings.WEBHOOK_CIRCUIT_COOLDOWN
+        self._consecutive_failures = 0
+        self._circuit_open_until = 0.0
+    
+    def _circuit_open(self) -> bool:
+        """Return True while the circuit breaker is open"""
+        return time.monotonic() < self._circuit_open_until
+    
+    def _record_success(self):
+        """Close the circuit after a successful delivery"""
+        self._consecutive_failures = 0
+        self._circuit_open_until = 0.0
+    
+    def _record_failure(self):
+        """Count a failed delivery and open the circuit once the threshold is reached"""
+        self._consecutive_failures += 1
+        if self._consecutive_failures >= self.circuit_threshold:
+            self._circuit_open_until = time.monotonic() + self.circuit_cooldown
+    
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the shared HTTP client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+                headers={"User-Agent": "CapiBot-Voice-Service/1.0.0"}
+            )
+        return self._client
+    
+    async def close(self):
+        """Close the shared HTTP client and its pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
     
     async def send_transcription_result(
         self, 
@@ -35,12 +79,16 @@ class WebhookService:
             bool: True if webhook was successful, False otherwise
         """
         
+        if self._circuit_open():
+            logger.debug("Webhook circuit open, skipping transcription result delivery")
+            return False
+        
         payload = {
             "transcription": {
                 "text": text,
                 "language": language,
                 "duration": duration,
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
                 "api_key_name": api_key_name,
                 "source": "capibot-voice-service"
             },
@@ -53,36 +101,34 @@ class WebhookService:
         
         for attempt in range(self.retries):
             try:
-                async with httpx.AsyncClient(timeout=self.timeout) as client:
-                    response = await client.post(
-                        self.webhook_url,
-                        json=payload,
-                        headers={
-                            "Content-Type": "application/json",
-                            "User-Agent": "CapiBot-Voice-Service/1.0.0"
-                        }
-                    )
+                client = await self._get_client()
+                response = await client.post(
+                    self.webhook_url,
+                    content=orjson.dumps(payload),
+                    headers={"Content-Type": "application/json"}
+                )
+                
+                if response.status_code in [200, 201, 202]:
+                    logger.debug("Webhook sent successfully to n8n (attempt %d)", attempt + 1)
+                    self._record_success()
+                    return True
+                else:
+                    logger.warning("Webhook failed with status %d (attempt %d)", response.status_code, attempt + 1)
                     
-                    if response.status_code in [200, 201, 202]:
-                        print(f"Webhook sent successfully to n8n (attempt {attempt + 1})")
-                        return True
-                    else:
-                        print(f"Webhook failed with status {response.status_code} (attempt {attempt + 1})")
-                        
             except httpx.TimeoutException:
-                print(f"Webhook timeout (attempt {attempt + 1})")
+                logger.warning("Webhook timeout (attempt %d)", attempt + 1)
             except httpx.ConnectError:
-                print(f"Webhook connection error (attempt {attempt + 1})")
+                logger.warning("Webhook connection error (attempt %d)", attempt + 1)
             except Exception as e:
-                print(f"Webhook error: {e} (attempt {attempt + 1})")
+                logger.warning("Webhook error: %s (attempt %d)", e, attempt + 1)
             
-            # Wait before retry (exponential backoff)
+            # Wait before retry (exponential backoff with full jitter)
             if attempt < self.retries - 1:
-                wait_time = 2 ** attempt
-                print(f"Retrying webhook in {wait_time} seconds...")
+                wait_time = random.uniform(0, min(2 ** attempt, 10))
                 await asyncio.sleep(wait_time)
         
-        print(f"Webhook failed after {self.retries} attempts")
+        logger.error("Webhook failed after %d attempts", self.retries)
+        self._record_failure()
         return False
     
     async def send_error_notification(
@@ -103,10 +149,14 @@ class WebhookService:
             bool: True if webhook was successful, False otherwise
         """
         
+        if self._circuit_open():
+            logger.debug("Webhook circuit open, skipping error notification")
+            return False
+        
         payload = {
             "error": {
                 "message": error_message,
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
                 "api_key_name": api_key_name,
                 "source": "capibot-voice-service"
             },
@@ -117,25 +167,25 @@ class WebhookService:
         }
         
         try:
-            async with httpx.AsyncClient(timeout=self.timeout) as client:
-                response = await client.post(
-                    self.webhook_url,
-                    json=payload,
-                    headers={
-                        "Content-Type": "application/json",
-                        "User-Agent": "CapiBot-Voice-Service/1.0.0"
-                    }
-                )
+            client = await self._get_client()
+            response = await client.post(
+                self.webhook_url,
+                content=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"}
+            )
+            
+            if response.status_code in [200, 201, 202]:
+                logger.debug("Error notification sent to n8n")
+                self._record_success()
+                return True
+            else:
+                logger.warning("Error notification failed with status %d", response.status_code)
+                self._record_failure()
+                return False
                 
-                if response.status_code in [200, 201, 202]:
-                    print("Error notification sent to n8n")
-                    return True
-                else:
-                    print(f"Error notification failed with status {response.status_code}")
-                    return False
-                    
         except Exception as e:
-            print(f"Error notification failed: {e}")
+            logger.warning("Error notification failed: %s", e)
+            self._record_failure()
             return False
 
 # Global service instance
@@ -0,0 +1,69 @@
+from fastapi.testclient import TestClient
+from types import SimpleNamespace
+import copy
+import pytest
+
+# app.main is imported inside the fastapi_app fixture, so collection and runs that don't
+# need the app don't load the transcription/webhook services
+
+@pytest.fixture(scope="session")
+def fastapi_app():
+    # Single place that imports the application; every fixture shares this instance.
+    # Named fastapi_app so it doesn't shadow the app package in fixture signatures
+    from app.main import app
+    return app
+
+@pytest.fixture(scope="session")
+def client(fastapi_app):
+    # Single client for the whole session so startup/shutdown events run once and
+    # the same transport is reused. Tests must use this fixture instead of creating
+    # their own TestClient(app), which would rerun the app lifespan for every test.
+    # Startup/shutdown hooks must not send index creation or last_used writes to the
+    # real DATABASE_URL, so the database calls are replaced for the client's lifetime
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("app.main.ensure_indexes", _noop)
+        mp.setattr("app.main.flush_last_used", _noop)
+        mp.setattr("app.main.flush_last_used_periodically", _noop)
+        with TestClient(fastapi_app) as c:
+            yield c
+
+async def _noop(*args, **kwargs):
+    return None
+
+async def _webhook_delivered(*args, **kwargs):
+    return True
+
+@pytest.fixture(scope="session")
+def _mock_templates():
+    # Plain stubs (no call tracking needed), built once per session; each test
+    # receives shallow copies, so attributes set by one test don't leak to others
+    return {
+        "transcription_service": SimpleNamespace(
+            executor=None,  # None -> default loop executor
+            validate_audio_file=lambda *args, **kwargs: True,
+        ),
+        "webhook_service": SimpleNamespace(
+            send_transcription_result=_webhook_delivered,
+            send_error_notification=_webhook_delivered,
+        ),
+        "validate_api_key": lambda: {"name": "test-key", "_id": "123"},
+    }
+
+@pytest.fixture
+def mocks(monkeypatch, fastapi_app, _mock_templates):
+    from app.auth import validate_api_key
+    
+    m = {name: copy.copy(template) for name, template in _mock_templates.items()}
+    monkeypatch.setattr("app.main.transcription_service", m["transcription_service"])
+    monkeypatch.setattr("app.main.webhook_service", m["webhook_service"])
+    # validate_api_key is bound through Depends, so it is replaced via dependency_overrides
+    monkeypatch.setitem(fastapi_app.dependency_overrides, validate_api_key, m["validate_api_key"])
+    return m
+
+@pytest.fixture(scope="session")
+def audio_upload():
+    return {"audio": ("test.mp3", b"dummy content", "audio/mpeg")}
+
+@pytest.fixture(scope="session")
+def base64_payload():
+    return {"audio_base64": "data:audio/mp3;base64,dummy"}
@@ -0,0 +1,57 @@
+from cachetools import TTLCache
+from types import SimpleNamespace
+import asyncio
+import pytest
+
+KEY_DOC = {"_id": "key-1", "key": "valid-key", "name": "test-key", "active": True}
+
+@pytest.fixture
+def collection(monkeypatch):
+    from app import auth
+
+    # Caches and pending timestamps are module state; start every test empty
+    monkeypatch.setattr(auth, "_key_cache", TTLCache(maxsize=10, ttl=60))
+    monkeypatch.setattr(auth, "_invalid_key_cache", TTLCache(maxsize=10, ttl=60))
+    monkeypatch.setattr(auth, "_pending_last_used", {})
+
+    async def find_one(query):
+        fake.find_one_calls.append(query)
+        return KEY_DOC if query["key"] == KEY_DOC["key"] else None
+
+    fake = SimpleNamespace(find_one=find_one, find_one_calls=[])
+    monkeypatch.setattr(auth, "api_keys_collection", fake)
+    return fake
+
+def _validate(api_key):
+    from app.auth import validate_api_key
+    return asyncio.run(validate_api_key(api_key_header=api_key, credentials=None))
+
+def test_cache_hit_skips_find_one(collection):
+    assert _validate("valid-key") == KEY_DOC
+    assert _validate("valid-key") == KEY_DOC
+    assert len(collection.find_one_calls) == 1
+
+def test_invalid_key_is_negatively_cached(collection):
+    from fastapi import HTTPException
+
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc_info:
+            _validate("unknown-key")
+        assert exc_info.value.status_code == 401
+    assert len(collection.find_one_calls) == 1
+
+def test_failed_flush_requeues_without_overwriting_newer_timestamp(collection):
+    from app import auth
+
+    auth._pending_last_used.update({"key-1": 100.0, "key-2": 200.0})
+
+    async def failing_bulk_write(operations, ordered=True):
+        # A request arrives while the write is in flight and records a newer timestamp
+        auth._pending_last_used["key-1"] = 300.0
+        raise RuntimeError("database unavailable")
+
+    collection.bulk_write = failing_bulk_write
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(auth.flush_last_used())
+    assert auth._pending_last_used == {"key-1": 300.0, "key-2": 200.0}
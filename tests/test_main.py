@@ -1,67 +1,67 @@
-from fastapi.testclient import TestClient
-from app.main import app
-from unittest.mock import patch, MagicMock
 import pytest
 
-client = TestClient(app)
+EXPECTED_ROOT = {
+    "message": "CapiBot Voice Recognition Service",
+    "status": "running",
+    "version": "1.0.0"
+}
 
-def test_read_main():
+def test_read_main(client):
     response = client.get("/")
     assert response.status_code == 200
-    assert response.json() == {
-        "message": "CapiBot Voice Recognition Service",
-        "status": "running",
-        "version": "1.0.0"
-    }
+    assert response.json() == EXPECTED_ROOT
 
-def test_health_check():
+def test_health_check(client):
     response = client.get("/health")
     assert response.status_code == 200
-    assert response.json()["status"] == "healthy"
+    body = response.json()
+    assert body["status"] == "healthy"
 
-@patch("app.main.transcription_service")
-@patch("app.main.webhook_service")
-@patch("app.main.validate_api_key")
-def test_transcribe_audio_file(mock_validate, mock_webhook, mock_transcription):
-    # Mock auth
-    mock_validate.return_value = {"name": "test-key", "_id": "123"}
+@pytest.mark.parametrize(
+    "request_arg,payload_fixture,mock_fn_name,mock_return",
+    [
+        ("files", "audio_upload", "transcribe_audio_file", ("Teste de transcrição", "pt", 5.0)),
+        ("json", "base64_payload", "transcribe_base64_audio", ("Teste base64", "pt", 3.0)),
+    ],
+    ids=["file", "base64"],
+)
+def test_transcribe(client, request, request_arg, payload_fixture, mock_fn_name, mock_return):
+    # Resolved lazily so only the transcribe tests pay for mock setup
+    mocks = request.getfixturevalue("mocks")
     
-    # Mock transcription
-    mock_transcription.validate_audio_file.return_value = True
-    mock_transcription.transcribe_audio_file.return_value = ("Teste de transcrição", "pt", 5.0)
+    # Mock transcription (auth and webhook stubs come from the mocks fixture)
+    setattr(mocks["transcription_service"], mock_fn_name, lambda *args, **kwargs: mock_return)
     
-    # Mock webhook
-    mock_webhook.send_transcription_result.return_value = True
-    
-    # Create a dummy file
-    files = {"audio": ("test.mp3", b"dummy content", "audio/mpeg")}
-    
-    response = client.post("/transcribe", files=files)
+    payload = request.getfixturevalue(payload_fixture)
+    response = client.post("/transcribe", **{request_arg: payload})
     
     assert response.status_code == 200
     data = response.json()
     assert data["status"] == "success"
+    assert data["text"] == mock_return[0]
     assert data["transcription_id"].startswith("trans_123_")
 
-@patch("app.main.transcription_service")
-@patch("app.main.webhook_service")
-@patch("app.main.validate_api_key")
-def test_transcribe_base64(mock_validate, mock_webhook, mock_transcription):
-    # Mock auth
-    mock_validate.return_value = {"name": "test-key", "_id": "123"}
+def test_transcribe_invalid_json(client, mocks):
+    response = client.post(
+        "/transcribe",
+        content=b'{"audio_base64": ',
+        headers={"Content-Type": "application/json"},
+    )
     
-    # Mock transcription
-    mock_transcription.transcribe_base64_audio.return_value = ("Teste base64", "pt", 3.0)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid JSON body"
+
+def test_transcribe_at_capacity(client, mocks, monkeypatch, audio_upload):
+    import asyncio
+    from app.config import settings
     
-    # Mock webhook
-    mock_webhook.send_transcription_result.return_value = True
+    mocks["transcription_service"].transcribe_audio_file = lambda *args, **kwargs: ("", "pt", 0.0)
     
-    payload = {
-        "audio_base64": "data:audio/mp3;base64,dummy"
-    }
+    # No free slots: the request times out waiting for admission and is shed
+    monkeypatch.setattr("app.main.transcription_semaphore", asyncio.Semaphore(0))
+    monkeypatch.setattr(settings, "TRANSCRIPTION_QUEUE_TIMEOUT", 0.01)
     
-    response = client.post("/transcribe", json=payload)
+    response = client.post("/transcribe", files=audio_upload)
     
-    assert response.status_code == 200
-    data = response.json()
-    assert data["status"] == "success"
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
@@ -0,0 +1,29 @@
+import base64
+import pytest
+
+AUDIO_BYTES = bytes(range(256)) * 4
+
+@pytest.fixture
+def service(monkeypatch):
+    from app.services import transcription
+
+    # Small, non-multiple-of-4 slices so inputs span several decoding steps
+    monkeypatch.setattr(transcription, "BASE64_CHUNK_SIZE", 7)
+    return transcription.transcription_service
+
+@pytest.mark.parametrize(
+    "audio_base64",
+    [
+        base64.b64encode(AUDIO_BYTES).decode(),
+        "data:audio/mp3;base64," + base64.b64encode(AUDIO_BYTES).decode(),
+        base64.encodebytes(AUDIO_BYTES).decode(),
+        "data:audio/mp3;base64," + base64.encodebytes(AUDIO_BYTES).decode().replace("\n", "\r\n"),
+    ],
+    ids=["plain", "data-uri", "wrapped", "data-uri-wrapped"],
+)
+def test_decode_base64_audio(service, audio_base64):
+    assert service._decode_base64_audio(audio_base64).read() == AUDIO_BYTES
+
+def test_decode_base64_audio_truncated(service):
+    with pytest.raises(ValueError):
+        service._decode_base64_audio(base64.b64encode(AUDIO_BYTES).decode()[:-1])
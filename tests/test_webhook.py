@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+import asyncio
+import pytest
+
+@pytest.fixture
+def clock(monkeypatch):
+    from app.services import webhook
+
+    # Fake monotonic clock, advanced by the test instead of sleeping through the cooldown
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(webhook, "time", SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+@pytest.fixture
+def service():
+    from app.services.webhook import WebhookService
+
+    service = WebhookService()
+    service.retries = 1
+    service.circuit_threshold = 2
+    service.circuit_cooldown = 30
+    service.posts = []
+
+    async def post(url, **kwargs):
+        service.posts.append(url)
+        return SimpleNamespace(status_code=service.status_code)
+
+    async def get_client():
+        return SimpleNamespace(post=post)
+
+    service._get_client = get_client
+    service.status_code = 500
+    return service
+
+def _send(service):
+    return asyncio.run(service.send_error_notification("boom", "test-key"))
+
+def test_circuit_opens_after_threshold_and_skips_delivery(clock, service):
+    assert _send(service) is False
+    assert _send(service) is False
+    assert len(service.posts) == 2
+
+    # Open: no request is made until the cooldown ends
+    clock.value += 29
+    assert _send(service) is False
+    assert len(service.posts) == 2
+
+def test_circuit_half_open_after_cooldown(clock, service):
+    _send(service)
+    _send(service)
+
+    # Cooldown over: a failed trial reopens the circuit straight away
+    clock.value += 30
+    assert _send(service) is False
+    assert len(service.posts) == 3
+    assert _send(service) is False
+    assert len(service.posts) == 3
+
+    # Next trial succeeds and closes the circuit
+    clock.value += 30
+    service.status_code = 200
+    assert _send(service) is True
+    assert _send(service) is True
+    assert len(service.posts) == 5